@@ -10,4 +10,7 @@ setup(
         "numpy",
         "scipy",
     ],
+    extras_require={
+        "fast": ["orjson"],
+    },
 )
\ No newline at end of file
@@ -1,10 +1,13 @@
 """Utility functions around IO operations on filesystems."""
 import base64
+import functools
 import io
 import json
+import mmap
 import os
 import pickle as pkl
 import platform
+import re
 import shutil
 from glob import glob
 import joblib
@@ -12,6 +15,23 @@ import joblib
 import pandas as pd
 import yaml
 
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    from pyarrow import dataset as pa_ds
+    from pyarrow import feather as pa_feather
+    from pyarrow import parquet as pq
+except ModuleNotFoundError:
+    pa = None
+
+# the running OS does not change, so look it up once instead of per IO call
+_OS = platform.system().lower()
+
+_WIN_RE = re.compile(r"^[A-Z]:")
+
+# passed through to pandas readers/writers; None for local filesystems
+storage_options = None
+
 def local_folder_s3():
     local_folder_path = "tmp/"
     return local_folder_path
@@ -26,10 +46,7 @@ def is_colab():
 
 
 def is_win(path):
-    if (path[1] == ":") and (path[0].isupper()):
-        return True
-    else:
-        return False
+    return bool(_WIN_RE.match(path))
 
 
 def is_linux(path):
@@ -39,6 +56,10 @@ def is_linux(path):
         return False
 
 
+def is_remote(path):
+    return "://" in path
+
+
 def win_to_linux(path):
     if is_linux(path):
         return path
@@ -58,36 +79,208 @@ def linux_to_win(path):
     path = "\\".join(path)
     return path
 
+@functools.lru_cache(maxsize=4096)
 def adj_path(path):
-    path_ = path
-    try:
-        if is_win(path):
-            if platform.system().lower() == "linux":
-                path = win_to_linux(path)
-        elif is_linux(path):
-            if platform.system().lower() == "windows":
-                path = linux_to_win(path)
-        return path
-    except IndexError as e:
-        return path_
+    if _OS == "linux" and is_win(path):
+        return win_to_linux(path)
+    if _OS == "windows" and is_linux(path):
+        return linux_to_win(path)
+    return path
 
 def read_preprocess(df):
-    df = df.drop(columns=["Unnamed: 0"], errors="ignore")
+    if "Unnamed: 0" in df.columns:
+        df = df.drop(columns="Unnamed: 0")
     if "date" in df.columns:
         df = df.pd_cols_to_datetime()
     return df
 
-def read(filepath, concat=None, **kwargs):
+def _arrow_to_pandas(tbl):
+    # split_blocks keeps columns zero-copy instead of consolidating them and
+    # self_destruct frees each Arrow column once converted, so peak memory
+    # stays near one copy of the data
+    return tbl.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def filter_expression(filters, schema=None):
+    """
+    Turns `filters` in pd.read_parquet's list-of-tuples form (or an existing
+    pyarrow expression) into a pyarrow compute expression.
+
+    Given the `schema` being scanned, literal values are cast to their
+    column's type first, so e.g. ("date", ">=", "2024-01-01") also works
+    against a timestamp column.
+    """
+    if filters is None or isinstance(filters, pa_ds.Expression):
+        return filters
+    if schema is not None:
+        filters = [cast_filter_term(term, schema) for term in filters]
+    return pq.filters_to_expression(filters)
+
+
+def cast_filter_term(term, schema):
+    if isinstance(term, list):
+        return [cast_filter_term(t, schema) for t in term]
+    col, op, val = term
+    if col not in schema.names:
+        return term
+    typ = schema.field(col).type
+    try:
+        if op in ("in", "not in"):
+            val = pa.array(list(val)).cast(typ)
+        else:
+            val = pa.scalar(val).cast(typ)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        # e.g. 1.5 against an int column; let the compute kernel compare it
+        return term
+    return (col, op, val)
+
+
+def name_blank_columns(tbl):
+    return tbl.rename_columns(
+        [name or f"Unnamed: {i}" for i, name in enumerate(tbl.column_names)]
+    )
+
+
+def _read_arrow(filepath, ext, columns=None, filters=None):
+    """
+    Reads a local csv, parquet or feather file (or parquet folder) into a
+    pyarrow Table.
+
+    Parquet and feather are memory-mapped, so column buffers are served from
+    the page cache instead of being copied into fresh memory, and parquet
+    gets `columns`/`filters` pushed down to skip column chunks and row
+    groups. Unnamed csv header cells get pandas' "Unnamed: <i>" names so the
+    written index column is still dropped by `read_preprocess`.
+    """
+    if ext == "parquet":
+        if filters is not None:
+            schema = pa_ds.dataset(filepath, format="parquet").schema
+            filters = filter_expression(filters, schema)
+        return pq.read_table(
+            filepath,
+            columns=columns,
+            filters=filters,
+            memory_map=True,
+            use_pandas_metadata=True,
+        )
+    if filters is not None:
+        # the dataset scanner can filter on columns left out of `columns`
+        return _read_dataset([filepath], ext, columns=columns, filters=filters)
+    if ext == "feather":
+        return pa_feather.read_table(filepath, columns=columns, memory_map=True)
+    convert_options = pa_csv.ConvertOptions(include_columns=columns)
+    return name_blank_columns(
+        pa_csv.read_csv(filepath, convert_options=convert_options)
+    )
+
+
+def pickle_buffers_path(filepath):
+    return f"{filepath}.buffers"
+
+
+def dump_pickle(data, f, filepath, out_of_band=False, **kwargs):
+    """
+    Pickles `data` with protocol 5, which frames numpy/pandas buffers without
+    the extra copies of older protocols; the file stays a plain pickle.
+
+    With `out_of_band=True` large buffers are instead kept in a
+    `<filepath>.buffers` side file (each stored as an 8-byte little-endian
+    length followed by its raw bytes). Such a .pkl is only readable through
+    `read` with its side file next to it.
+    """
+    kwargs.setdefault("protocol", 5)
+    buffers = []
+    if out_of_band and kwargs["protocol"] >= 5 and "buffer_callback" not in kwargs:
+        kwargs["buffer_callback"] = buffers.append
+    pkl.dump(data, f, **kwargs)
+
+    buffers_path = pickle_buffers_path(filepath)
+    if buffers:
+        with open(buffers_path, "wb") as bf:
+            for buffer in buffers:
+                raw = buffer.raw()
+                bf.write(raw.nbytes.to_bytes(8, "little"))
+                bf.write(raw)
+    elif os.path.exists(buffers_path):
+        os.remove(buffers_path)
+
+
+def load_pickle(f, filepath):
+    """
+    Unpickles a file written by `dump_pickle`. Out-of-band buffers are
+    served copy-on-write from a memory map of the side file.
+    """
+    buffers_path = pickle_buffers_path(filepath)
+    if not os.path.exists(buffers_path) or os.path.getsize(buffers_path) == 0:
+        return pkl.load(f)
+    with open(buffers_path, "rb") as bf:
+        view = memoryview(mmap.mmap(bf.fileno(), 0, access=mmap.ACCESS_COPY))
+    buffers = []
+    pos = 0
+    while pos < len(view):
+        size = int.from_bytes(view[pos:pos + 8], "little")
+        pos += 8
+        buffers.append(view[pos:pos + size])
+        pos += size
+    return pkl.Unpickler(f, buffers=buffers).load()
+
+
+ARROW_DATASET_FORMATS = {"csv": "csv", "parquet": "parquet", "feather": "feather"}
+
+
+def _read_dataset(files, ext, columns=None, filters=None):
+    """
+    Reads `files` of one format as a single pyarrow dataset, so fragments are
+    scanned in parallel and land in one table without per-file DataFrames.
+    """
+    dataset = pa_ds.dataset(files, format=ARROW_DATASET_FORMATS[ext])
+    tbl = dataset.to_table(
+        columns=columns, filter=filter_expression(filters, dataset.schema)
+    )
+    return name_blank_columns(tbl)
+
+
+def use_arrow(filepath, ext, kwargs, filters=None):
+    """
+    Whether a local csv/parquet/feather read can go through pyarrow.
+
+    pyarrow infers csv types differently from pd.read_csv (ISO strings come
+    back as timestamps, types are inferred from the first block), so csv
+    only takes this path when asked for with `engine="pyarrow"` or when
+    `filters` need the Arrow scanner.
+    """
+    engine = kwargs.get("engine")
+    kwargs = {k: v for k, v in kwargs.items() if k != "engine"}
+    if ext == "csv" and engine != "pyarrow" and filters is None:
+        return False
+    return (
+        pa is not None
+        and engine in (None, "pyarrow")
+        and not kwargs
+        and not is_remote(filepath)
+    )
+
+
+def read(filepath, concat=None, columns=None, filters=None, **kwargs):
     """
     Reads data from various file types and sources.
 
     Supported file extensions and their corresponding data types:
     - .xlsx, .xls: A dictionary of pandas DataFrames.
-    - .csv: A single pandas DataFrame.
-    - .parquet: A single pandas DataFrame.
+    - .csv: A single pandas DataFrame. Local files are parsed with pyarrow's
+      multithreaded reader when `engine="pyarrow"` or `filters` is passed;
+      column types are then Arrow's inference rather than pd.read_csv's
+      (e.g. ISO dates come back as an object column of datetime.date values,
+      ISO timestamps as datetime64).
+    - .parquet: A single pandas DataFrame. Local files without extra kwargs
+      are memory-mapped through pyarrow when it is installed.
     - .feather: A single pandas DataFrame.
     - .sas7bdat: A single pandas DataFrame.
-    - .pkl: Any Python object that can be pickled.
+    - .pkl: Any Python object that can be pickled. Out-of-band buffers from a
+      `<filepath>.buffers` side file (`write(..., out_of_band=True)`) are
+      picked up when present.
+    - .joblib: Any object saved with joblib. Numpy arrays are memory-mapped
+      read-only by default; pass `mmap_mode=None` to load them into memory.
     - .ubj: Any Python object that can be converted to UBJSON.
     - .yml|.yaml: Any Python object that can be converted to YAML.
 
@@ -98,7 +291,18 @@ def read(filepath, concat=None, **kwargs):
     concat : str or list of str, default None
         If the filepath points to a directory, specifies the file extension(s)
         to use for concatenating multiple files. If None and the filepath points
-        to a directory, defaults to 'parquet'.
+        to a directory, defaults to 'parquet'. Parquet and feather (and csv
+        under the same opt-in as single csv files) are read through pyarrow
+        when it is installed and concatenated as Arrow tables before one
+        conversion.
+    columns : list of str, default None
+        Only read these columns. Used by csv, parquet and feather files and
+        folder concatenations of them.
+    filters : list of tuples or pyarrow expression, default None
+        Row filters in the `pd.read_parquet` format, e.g.
+        `[("timestamp", ">=", "2024-01-01")]`. Pushed down into the pyarrow
+        scan, so csv and feather filters need pyarrow. Values are cast to
+        the column's type, so date strings match timestamp columns.
     **kwargs : dict
         Additional keyword arguments to be passed to the appropriate
         file-reading function.
@@ -128,6 +332,7 @@ def read(filepath, concat=None, **kwargs):
     >>> df = read(filepath='data.pkl', model=MyModel, assign_model=True)
     >>> df = read(filepath='data.xlsx', sheet_name='Sheet1')
     >>> df = read(filepath='data_folder', concat='csv')
+    >>> df = read(filepath='data.parquet', columns=['close'], filters=[('volume', '>', 0)])
 
     """
     assert isinstance(filepath, str)
@@ -142,17 +347,62 @@ def read(filepath, concat=None, **kwargs):
         if isinstance(concat, str):
             concat = [concat]
         files = []
+        file_exts = []
         folder_path = f"{filepath}/"
         for file in concat:
-            files.extend(glob(f"{folder_path}/*{file}"))
-        if files:
-            df = pd.concat([read(filepath=f, **kwargs) for f in files])
+            matches = glob(f"{folder_path}/*{file}")
+            files.extend(matches)
+            file_exts.extend([file] * len(matches))
+        if (
+            files
+            and all(file in ARROW_DATASET_FORMATS for file in concat)
+            and all(use_arrow(filepath, file, kwargs, filters) for file in concat)
+        ):
+            if concat == ["feather"]:
+                tbl = _read_dataset(files, "feather", columns=columns, filters=filters)
+            else:
+                # csv types are inferred per file and a dataset would force the
+                # first file's schema on the rest, and a parquet dataset drops
+                # the pandas index metadata; read each file and promote.
+                # stay in Arrow: concat_tables only stitches chunks together,
+                # the single pandas conversion happens afterwards
+                tbl = pa.concat_tables(
+                    [
+                        _read_arrow(f, file_ext, columns=columns, filters=filters)
+                        for f, file_ext in zip(files, file_exts)
+                    ],
+                    promote_options="permissive",
+                )
+            df = _arrow_to_pandas(tbl)
+            if all(file == "feather" for file in concat):
+                # feather reads have never gone through read_preprocess
+                return df
+            return read_preprocess(df)
+        elif files:
+            df = pd.concat(
+                [
+                    read(filepath=f, columns=columns, filters=filters, **kwargs)
+                    for f in files
+                ]
+            )
             return df
         else:
             return pd.DataFrame()
     elif concat == "parquet":
+        if use_arrow(filepath, "parquet", kwargs, filters):
+            return read_preprocess(
+                _arrow_to_pandas(
+                    _read_arrow(filepath, "parquet", columns=columns, filters=filters)
+                )
+            )
         return read_preprocess(
-            pd.read_parquet(filepath, storage_options=storage_options, **kwargs)
+            pd.read_parquet(
+                filepath,
+                columns=columns,
+                filters=filters,
+                storage_options=storage_options,
+                **kwargs,
+            )
         )
 
     assert isinstance(filepath, str)
@@ -183,27 +433,56 @@ def read(filepath, concat=None, **kwargs):
         df = pd.read_excel(filepath, storage_options=storage_options, **kwargs)
         return read_preprocess(df)
     elif ext == "csv":
-        df = pd.read_csv(filepath, storage_options=storage_options, **kwargs)
+        if use_arrow(filepath, ext, kwargs, filters):
+            df = _arrow_to_pandas(
+                _read_arrow(filepath, ext, columns=columns, filters=filters)
+            )
+        elif filters is not None:
+            raise NotImplementedError("csv filters are only supported via pyarrow")
+        else:
+            df = pd.read_csv(
+                filepath, usecols=columns, storage_options=storage_options, **kwargs
+            )
         return read_preprocess(df)
     elif ext == "parquet":
-        df = pd.read_parquet(filepath, storage_options=storage_options, **kwargs)
+        if use_arrow(filepath, ext, kwargs, filters):
+            df = _arrow_to_pandas(
+                _read_arrow(filepath, ext, columns=columns, filters=filters)
+            )
+        else:
+            df = pd.read_parquet(
+                filepath,
+                columns=columns,
+                filters=filters,
+                storage_options=storage_options,
+                **kwargs,
+            )
         return read_preprocess(df)
     elif ext == "sas7bdat":
         df = pd.read_sas(filepath, storage_options=storage_options, **kwargs)
-        df[df.select_dtypes("O").columns] = df.select_dtypes("O").apply(
-            lambda x: x.str.decode("utf-8") if isinstance(x[0], bytes) else x
-        )
+        for col in df.select_dtypes("O").columns:
+            s = df[col]
+            if s.size and isinstance(s.iloc[0], (bytes, bytearray)):
+                df[col] = s.str.decode("utf-8")
         return read_preprocess(df)
     elif ext == "feather":
-        df = pd.read_feather(filepath, storage_options=storage_options, **kwargs)
+        if use_arrow(filepath, ext, kwargs, filters):
+            return _arrow_to_pandas(
+                _read_arrow(filepath, ext, columns=columns, filters=filters)
+            )
+        elif filters is not None:
+            raise NotImplementedError("feather filters are only supported via pyarrow")
+        df = pd.read_feather(
+            filepath, columns=columns, storage_options=storage_options, **kwargs
+        )
         return df
 
     elif ext in ["pkl", "yml", "yaml", "pickle", "joblib"]:
         f = open(filepath, "rb")
         if ext in ["pkl", "pickle"]:
-            df = pkl.load(f)
+            df = load_pickle(f, filepath)
         elif ext == "joblib":
-            model = joblib.load(filepath)
+            model = joblib.load(filepath, mmap_mode=kwargs.get("mmap_mode", "r"))
             return model
         else:
             df = yaml.safe_load(f)
@@ -212,6 +491,15 @@ def read(filepath, concat=None, **kwargs):
         return open(filepath, "r").read()
 
 
+# zstd compresses OHLCV frames well below snappy, dictionary encoding covers
+# repeated tickers/strings, and large row groups keep footer metadata small
+PARQUET_WRITE_DEFAULTS = {
+    "engine": "pyarrow",
+    "use_dictionary": True,
+    "row_group_size": 1_000_000,
+}
+
+
 def write(data, filepath, **kwargs):
     """
     Write data to a file specified by `filepath`. The type of file is inferred from the file extension.
@@ -219,9 +507,12 @@ def write(data, filepath, **kwargs):
     Supported file extensions and their corresponding data types:
     - .xlsx, .xls: A dictionary of pandas DataFrames or an pandas DataFrame.
     - .csv: A single pandas DataFrame.
-    - .parquet: A single pandas DataFrame.
+    - .parquet: A single pandas DataFrame. Written with zstd compression and
+      dictionary encoding unless overridden through kwargs.
     - .feather: A single pandas DataFrame.
-    - .pkl: Any picklable object.
+    - .pkl: Any picklable object, pickled with protocol 5. Pass
+      `out_of_band=True` to keep large array buffers in a
+      `<filepath>.buffers` side file, which `read` maps back in.
     - .yml|.yaml: Any object that can be converted to YAML.
     - .ubj: Any model object.
 
@@ -274,6 +565,7 @@ def write(data, filepath, **kwargs):
         "pickle",
         "ubj",
         "joblib",
+        "feather",
     ]:
         raise NotImplementedError
     if ext in ["xlsx", "xls"]:
@@ -348,9 +640,19 @@ def write(data, filepath, **kwargs):
         data.to_csv(filepath, storage_options=storage_options, **kwargs)
     elif ext == "parquet":
         assert isinstance(data, pd.DataFrame)
+        parquet_kwargs = dict(kwargs)
+        # the defaults are pyarrow writer options; other engines reject them
+        if pa is not None and kwargs.get("engine", "pyarrow") == "pyarrow":
+            for key, value in PARQUET_WRITE_DEFAULTS.items():
+                parquet_kwargs.setdefault(key, value)
+            if "compression" not in kwargs:
+                parquet_kwargs["compression"] = "zstd"
+                parquet_kwargs.setdefault("compression_level", 3)
         try:
-            data.to_parquet(filepath, storage_options=storage_options, **kwargs)
+            data.to_parquet(filepath, storage_options=storage_options, **parquet_kwargs)
         except Exception as e:
+            if "column " not in str(e):
+                raise
             object_columns = str(e).split("column ")[1].split(" ")[0]
             data[object_columns] = data[object_columns].astype(str)
             write(data=data, filepath=filepath, **kwargs)
@@ -359,23 +661,13 @@ def write(data, filepath, **kwargs):
         assert isinstance(data, pd.DataFrame)
         data.to_feather(filepath, storage_options=storage_options, **kwargs)
     elif ext in ["pkl", "yml", "yaml", "joblib"]:
-        f = (
-                open(filepath, "wb")
-                if ext in ["pkl", "joblib"]
-                else open(filepath, "w")
-            )
-        f = (
-            open(filepath, "wb")
-            if ext in ["pkl", "joblib"]
-            else open(filepath, "w")
-        )
-        if ext == "pkl":
-            pkl.dump(data, f, **kwargs)
-        elif ext in ["yml", "yaml"]:
-            yaml.dump(dict(data), f)
-        elif ext == "joblib":
-            joblib.dump(data, f, **kwargs)
-        f.close()
+        with open(filepath, "wb" if ext in ["pkl", "joblib"] else "w") as f:
+            if ext == "pkl":
+                dump_pickle(data, f, filepath, **kwargs)
+            elif ext in ["yml", "yaml"]:
+                yaml.dump(dict(data), f)
+            elif ext == "joblib":
+                joblib.dump(data, f, **kwargs)
     elif ext == "ubj":
         data.save_model(filepath)
 
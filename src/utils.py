@@ -1,16 +1,27 @@
 from SmartApi import SmartConnect
 import os
-import urllib
+import urllib.error
+import urllib.request
 import json
+import numpy as np
 import pandas as pd
 import datetime as dt
 import time
+import threading
 import pytz
 from pyotp import TOTP
 from datetime import datetime
 import pytz
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from in_out import *
 
+try:
+    # parses the multi-MB scrip master several times faster than json
+    from orjson import loads as json_loads
+except ModuleNotFoundError:
+    from json import loads as json_loads
+
 
 def get_internet_time():
     """
@@ -34,45 +45,163 @@ def get_connection():
     obj = SmartConnect(api_key=key_secret[0])
     data = obj.generateSession(key_secret[2], key_secret[3], generate_totp(key_secret[4]))
 
-    instrument_url = "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json"
-    response = urllib.request.urlopen(instrument_url)
-    instrument_list = json.loads(response.read())
-    return obj, data, instrument_list
+    instrument_list = load_instrument_list()
+    # indexed once here so per-ticker calls don't rescan the scrip master
+    instrument_index = build_instrument_index(instrument_list)
+    return obj, data, instrument_list, instrument_index
 
-def token_lookup(ticker, instrument_list, exchange="NSE"):
-    for instrument in instrument_list:
-        if (
-            instrument["name"] == ticker
-            and instrument["exch_seg"] == exchange
-            and instrument["symbol"].split("-")[-1] == "EQ"
-        ):
-            return instrument["token"]
+INSTRUMENT_URL = "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json"
+INSTRUMENT_CACHE = os.path.expanduser("~/.cache/angel/scripmaster.feather")
+
+
+def load_instrument_list(url=INSTRUMENT_URL, cache_path=INSTRUMENT_CACHE):
+    """
+    Returns the scrip master as a list of dicts, cached on disk as feather.
+
+    The ETag/Last-Modified of the cached copy are sent as a conditional GET;
+    on 304 Not Modified the cache is read back (memory-mapped when pyarrow is
+    installed) instead of downloading and parsing the multi-MB json again.
+    Both files are written to a temp path and swapped in with os.replace, so
+    an interrupted write never leaves a partial cache behind.
+    """
+    validators_path = cache_path + ".json"
+    request = urllib.request.Request(url)
+    # the feather cache needs pyarrow; without it every call downloads
+    use_cache = pa is not None
+    if use_cache and os.path.exists(cache_path) and os.path.exists(validators_path):
+        with open(validators_path) as f:
+            validators = json.load(f)
+        if validators.get("ETag"):
+            request.add_header("If-None-Match", validators["ETag"])
+        if validators.get("Last-Modified"):
+            request.add_header("If-Modified-Since", validators["Last-Modified"])
+
+    try:
+        response = urllib.request.urlopen(request)
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        return read(cache_path).to_dict("records")
+
+    instrument_list = json_loads(response.read())
+    validators = {
+        key: response.headers[key]
+        for key in ["ETag", "Last-Modified"]
+        if response.headers.get(key)
+    }
+    if use_cache and validators:
+        tmp_cache_path = cache_path + ".tmp.feather"
+        write(pd.DataFrame(instrument_list), tmp_cache_path)
+        os.replace(tmp_cache_path, cache_path)
+        with open(validators_path + ".tmp", "w") as f:
+            json.dump(validators, f)
+        os.replace(validators_path + ".tmp", validators_path)
+    return instrument_list
+
+InstrumentIndex = namedtuple("InstrumentIndex", ["by_name", "by_token"])
 
 
-def symbol_lookup(token, instrument_list, exchange="NSE"):
+def instrument_frame(instrument_list):
+    """
+    Columnar (DataFrame) view of the scrip master with the symbol suffix
+    ("EQ", "BE", ...) split out once in a `suffix` column, so filters like
+    `all_equities` become a vectorized mask. Build it once and reuse it;
+    columns cover the union of keys across all records.
+    """
+    keys = dict.fromkeys(key for instrument in instrument_list for key in instrument)
+    columns = {
+        key: [instrument.get(key) for instrument in instrument_list] for key in keys
+    }
+    columns["suffix"] = [
+        instrument["symbol"].split("-")[-1] for instrument in instrument_list
+    ]
+    return pd.DataFrame(columns)
+
+
+def build_instrument_index(instrument_list):
+    """
+    Builds O(1) lookup dicts over the EQ instruments of `instrument_list`.
+
+    by_name maps (exch_seg, name) -> token and by_token maps
+    (exch_seg, token) -> name. The first matching instrument wins, same as
+    the linear scan it replaces.
+    """
+    by_name = {}
+    by_token = {}
     for instrument in instrument_list:
-        if (
-            instrument["token"] == token
-            and instrument["exch_seg"] == exchange
-            and instrument["symbol"].split("-")[-1] == "EQ"
-        ):
-            return instrument["name"]
-
-def all_equities(instrument_list):
+        if instrument["symbol"].split("-")[-1] != "EQ":
+            continue
+        exch = instrument["exch_seg"]
+        by_name.setdefault((exch, instrument["name"]), instrument["token"])
+        by_token.setdefault((exch, instrument["token"]), instrument["name"])
+    return InstrumentIndex(by_name, by_token)
+
+
+def _as_index(instruments):
+    if isinstance(instruments, InstrumentIndex):
+        return instruments
+    return build_instrument_index(instruments)
+
+
+def token_lookup(ticker, index, exchange="NSE"):
+    """
+    `index` is an InstrumentIndex; a raw instrument_list is also accepted but
+    gets indexed on every call.
+    """
+    return _as_index(index).by_name.get((exchange, ticker))
+
+
+def symbol_lookup(token, index, exchange="NSE"):
+    return _as_index(index).by_token.get((exchange, token))
+
+def all_equities(instruments):
+    """
+    EQ instruments of the scrip master. A list of dicts gives a list of dicts;
+    a frame from `instrument_frame` is filtered on its `suffix` column.
+    """
+    if isinstance(instruments, pd.DataFrame):
+        return instruments[instruments["suffix"] == "EQ"]
     eq_list = []
-    for l in instrument_list:
+    for l in instruments:
         if l["symbol"].split("-")[-1] == "EQ":
             eq_list.append(l)
-    
+
     return eq_list
 
 
+def _candle_frame(rows):
+    """
+    Builds the OHLCV frame for getCandleData rows ([date, o, h, l, c, v])
+    column-wise from typed arrays, skipping pandas' per-cell type inference.
+    All five numeric columns are float64, so missing values become NaN.
+    """
+    rows = rows or []
+    ohlcv = np.asarray([r[1:6] for r in rows], dtype=np.float64).reshape(-1, 5)
+    return pd.DataFrame(
+        {
+            "date": np.fromiter((r[0] for r in rows), dtype=object, count=len(rows)),
+            "open": ohlcv[:, 0],
+            "high": ohlcv[:, 1],
+            "low": ohlcv[:, 2],
+            "close": ohlcv[:, 3],
+            "volume": ohlcv[:, 4],
+        }
+    )
+
+
+def _parse_candle_dates(dates):
+    # candle timestamps look like 2024-01-01T09:15:00+05:30; dropping the
+    # offset keeps the exchange-local wall time without a tz_localize pass
+    return pd.to_datetime(dates.str.slice(0, 19), format="%Y-%m-%dT%H:%M:%S")
+
+
 def hist_data_extended(obj, ticker, duration, interval, instrument_list, exchange="NSE"):
     st_date = dt.date.today() - dt.timedelta(duration)
     end_date = dt.date.today() - dt.timedelta(1)
     st_date = dt.datetime(st_date.year, st_date.month, st_date.day, 3, 30)
     end_date = dt.datetime(end_date.year, end_date.month, end_date.day)
-    df_data = pd.DataFrame(columns=["date", "open", "high", "low", "close", "volume"])
+    frames = []
+    symboltoken = token_lookup(ticker, instrument_list)
 
     temp_st_date = st_date
     temp_end_date = st_date + dt.timedelta(30)
@@ -81,20 +210,14 @@ def hist_data_extended(obj, ticker, duration, interval, instrument_list, exchang
         time.sleep(0.4)  # avoiding throttling rate limit
         params = {
             "exchange": exchange,
-            "symboltoken": token_lookup(ticker, instrument_list),
+            "symboltoken": symboltoken,
             "interval": interval,
             "fromdate": (temp_st_date).strftime("%Y-%m-%d %H:%M"),
             "todate": (temp_end_date).strftime("%Y-%m-%d %H:%M"),
         }
         hist_data = obj.getCandleData(params)
-        temp = pd.DataFrame(
-            hist_data["data"],
-            columns=["date", "open", "high", "low", "close", "volume"],
-        )
-        df_data = pd.concat([
-            df_data,
-            temp
-        ])
+        temp = _candle_frame(hist_data["data"])
+        frames.append(temp)
         # end_date = dt.datetime.strptime(temp["date"].iloc[0][:16], "%Y-%m-%dT%H:%M")
         # if (
         #     len(temp) <= 1
@@ -106,31 +229,47 @@ def hist_data_extended(obj, ticker, duration, interval, instrument_list, exchang
         if temp_end_date > end_date:
             temp_end_date = end_date
 
+    df_data = pd.concat(frames) if frames else _candle_frame([])
+    df_data["date"] = _parse_candle_dates(df_data["date"])
     df_data.set_index("date", inplace=True)
-    df_data.index = pd.to_datetime(df_data.index)
-    df_data.index = df_data.index.tz_localize(None)
-    df_data.drop_duplicates(keep="first", inplace=True)
+    # windows can overlap at their boundaries, so dedupe on the timestamp only
+    df_data = df_data[~df_data.index.duplicated(keep="first")]
     return df_data
 
-def hist_data(obj, tickers,duration,interval,instrument_list,exchange="NSE"):
+def hist_data(obj, tickers,duration,interval,instrument_list,exchange="NSE",max_workers=8,requests_per_second=3):
     """
     intervals: ONE_MINUTE, THREE_MINUTE, FIVE_MINUTE, TEN_MINUTE, FIFTEEN_MINUTE, THIRTY_MINUTE, ONE_HOUR, and ONE_DAY.
+
+    Tickers are fetched on a thread pool of `max_workers` to overlap API
+    latency. When requests actually run concurrently, at most
+    `requests_per_second` of them are started in any one-second window
+    (the broker's historical-data limit); pass None to disable.
     """
 
-    hist_data_tickers = {} 
-    for ticker in tickers:
+    index = _as_index(instrument_list)
+    throttle = max_workers > 1 and requests_per_second
+    rate_limit = threading.Semaphore(requests_per_second or 1)
+
+    def _fetch_one(ticker):
+        if throttle:
+            rate_limit.acquire()
+            release = threading.Timer(1.0, rate_limit.release)
+            release.daemon = True
+            release.start()
         params = {
                  "exchange": exchange,
-                 "symboltoken": token_lookup(ticker,instrument_list),
+                 "symboltoken": token_lookup(ticker,index),
                  "interval": interval,
                  "fromdate": (dt.date.today() - dt.timedelta(duration)).strftime('%Y-%m-%d %H:%M'),
                  "todate": dt.datetime.now().strftime('%Y-%m-%d %H:%M')  
                  }
         hist_data = obj.getCandleData(params)
-        df_data = pd.DataFrame(hist_data["data"],
-                               columns = ["date","open","high","low","close","volume"])
+        df_data = _candle_frame(hist_data["data"])
+        df_data["date"] = _parse_candle_dates(df_data["date"])
         df_data.set_index("date",inplace=True)
-        df_data.index = pd.to_datetime(df_data.index)
-        df_data.index = df_data.index.tz_localize(None)
-        hist_data_tickers[ticker] = df_data
-    return hist_data_tickers
\ No newline at end of file
+        return df_data
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {ticker: executor.submit(_fetch_one, ticker) for ticker in tickers}
+    hist_data_tickers = {ticker: future.result() for ticker, future in futures.items()}
+    return hist_data_tickers